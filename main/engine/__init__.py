@@ -1,10 +1,14 @@
+import bisect
 import logging
-from typing import Optional
+import time
+from typing import Callable, Optional
 
 import pygame
 from pydantic import BaseModel, Field
 
+from main.engine.components import BaseComponent, SpatialHash
 from main.engine.screen import Screen, ScreenManager
+from main.type_aliases import SpriteEvents
 
 
 class EngineSettings(BaseModel):
@@ -13,17 +17,140 @@ class EngineSettings(BaseModel):
     fps: int = Field(60)
     display: int = Field(0)
     vsync: bool = Field(False)
+    # Sleep on the event queue until the next frame is due, instead of busy-ticking the clock
+    wait_for_events: bool = Field(False)
+    # Above this many dirty rects, flipping the whole display is cheaper than updating each rect
+    dirty_rect_threshold: int = Field(50)
+
+
+def _sprite_priority(sprite: pygame.sprite.Sprite) -> int:
+    """The draw priority of a sprite within its layer, lower is drawn first."""
+    return getattr(sprite, "layer", 0)
+
+
+def _merge_rects(rects: list[pygame.Rect]) -> list[pygame.Rect]:
+    """Merge overlapping rects into their unions, so no area is covered twice."""
+    merged = []
+    for rect in rects:
+        if not rect:
+            continue
+        rect = rect.copy()
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
 
 
 class Layer(pygame.sprite.RenderUpdates):
-    """A layer of sprites to render."""
+    """
+    A layer of sprites to render.
+
+    Sprites are kept sorted by their `layer` attribute (then insertion order) as they are added,
+    so drawing never has to sort. The `layer` of a sprite should not change while it is in a Layer.
+
+    Like pygame.sprite.LayeredDirty, the `dirty` (0: unchanged, 1: changed once, 2: always changed)
+    and `visible` flags of DirtySprites are honored, so unchanged sprites are only redrawn where
+    something else changed on top of or below them. Their `blendmode` is used as the blit's special_flags.
+
+    Components are kept in `hit_grid` while they are in the layer, however they are added or removed
+    (Group.add, Sprite.kill, ...), so mouse events can find them.
+    """
 
     priority: int
+    hit_grid: Optional[SpatialHash]
+    _sorted_sprites: list[pygame.sprite.Sprite]
 
-    def __init__(self, priority: int, *args, **kwargs):
+    def __init__(self, priority: int, *args, hit_grid: Optional[SpatialHash] = None, **kwargs):
+        # Needed before super().__init__, which adds the initial sprites
+        self._sorted_sprites = []
+        self.hit_grid = hit_grid
         super().__init__(*args, **kwargs)
         self.priority = priority
 
+    def add_internal(self, sprite: pygame.sprite.Sprite, layer: None = None):
+        """Add a sprite, keeping the sorted sprite list in order and the hit grid up to date."""
+        super().add_internal(sprite, layer)
+        bisect.insort_right(self._sorted_sprites, sprite, key=_sprite_priority)
+        if self.hit_grid is not None and isinstance(sprite, BaseComponent):
+            self.hit_grid.insert(sprite)
+            sprite.spatial_hash = self.hit_grid
+
+    def remove_internal(self, sprite: pygame.sprite.Sprite):
+        """Remove a sprite from the sorted sprite list and the hit grid too."""
+        super().remove_internal(sprite)
+        self._sorted_sprites.remove(sprite)
+        if self.hit_grid is not None and isinstance(sprite, BaseComponent):
+            self.hit_grid.remove(sprite)
+            sprite.spatial_hash = None
+
+    def sprites(self) -> list[pygame.sprite.Sprite]:
+        """A list of the sprites in draw order."""
+        return list(self._sorted_sprites)
+
+    def draw(self, surface: pygame.Surface) -> list[pygame.Rect]:
+        """Draw all visible sprites with a single batched blit, returning the areas of the surface drawn to."""
+        self.lostsprites = []
+        spritedict = self.spritedict
+        sprites = [sprite for sprite in self._sorted_sprites if getattr(sprite, "visible", 1)]
+
+        # Cull sprites outside of the drawable area before blitting, with a single C-level collision pass
+        visible_indices = surface.get_clip().collidelistall([sprite.rect for sprite in sprites])
+        visible_sprites = [sprites[i] for i in visible_indices]
+        new_rects = surface.blits([
+            (sprite.image, sprite.rect, None, getattr(sprite, "blendmode", 0)) for sprite in visible_sprites
+        ])
+
+        for sprite in self._sorted_sprites:
+            spritedict[sprite] = None
+            if getattr(sprite, "dirty", 2) == 1:
+                sprite.dirty = 0
+        spritedict.update(zip(visible_sprites, new_rects))
+
+        return new_rects
+
+    def get_dirty_areas(self, surface_rect: pygame.Rect) -> list[pygame.Rect]:
+        """The areas of the surface changed since the last draw, by removed or changed sprites."""
+        dirty_areas = self.lostsprites
+        self.lostsprites = []
+        spritedict = self.spritedict
+        for sprite in self._sorted_sprites:
+            if getattr(sprite, "dirty", 2):
+                if spritedict[sprite]:
+                    dirty_areas.append(spritedict[sprite])
+                if getattr(sprite, "visible", 1):
+                    dirty_areas.append(sprite.rect.clip(surface_rect))
+        return dirty_areas
+
+    def draw_areas(self, surface: pygame.Surface, areas: list[pygame.Rect]):
+        """Redraw the parts of the sprites that overlap the given non-overlapping areas of the surface."""
+        surface_rect = surface.get_rect()
+        spritedict = self.spritedict
+        blit_sequence = []
+        for sprite in self._sorted_sprites:
+            dirty = getattr(sprite, "dirty", 2)
+            if not getattr(sprite, "visible", 1):
+                if dirty:
+                    spritedict[sprite] = None
+                    if dirty == 1:
+                        sprite.dirty = 0
+                continue
+
+            # Only blit within the areas, as the rest of the sprite is already drawn
+            rect = sprite.rect
+            blendmode = getattr(sprite, "blendmode", 0)
+            for index in rect.collidelistall(areas):
+                area = rect.clip(areas[index])
+                blit_sequence.append((sprite.image, area, area.move(-rect.x, -rect.y), blendmode))
+
+            if dirty:
+                spritedict[sprite] = rect.clip(surface_rect)
+                if dirty == 1:
+                    sprite.dirty = 0
+
+        surface.blits(blit_sequence, doreturn=False)
+
 
 class Engine:
     """A tile and sprite based game engine."""
@@ -33,12 +160,27 @@ class Engine:
     logger: logging.Logger
     clock: pygame.time.Clock
     level: int | None
+    frame_deadline: float  # perf_counter time at which the next frame is due
     background_color: tuple[int, int, int]
     settings: EngineSettings
 
+    _event_handlers: dict[int, Callable[[pygame.event.Event], None]]  # event type: handler
     _layers: dict[str, Layer]  # name: layer
+    _sorted_layers: list[tuple[str, Layer]]  # (name, layer) in priority order
+    _hit_grid: SpatialHash  # all components in all layers, for mouse hit testing, kept up to date by the layers
+    _full_redraw: bool  # whether the whole display must be redrawn next frame
     screen_man: ScreenManager
 
+    # Event types handled by the engine itself, fetched separately from the event queue
+    ENGINE_EVENT_TYPES: tuple[int, ...] = (pygame.QUIT, pygame.VIDEORESIZE)
+    # Event types passed on to the sprites, in the order they arrived
+    SPRITE_EVENT_TYPES: tuple[int, ...] = (
+        pygame.MOUSEBUTTONDOWN,
+        pygame.MOUSEMOTION,
+        pygame.MOUSEBUTTONUP,
+        pygame.KEYDOWN,
+    )
+
     def __init__(self, settings: EngineSettings = EngineSettings()):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
@@ -61,16 +203,24 @@ class Engine:
 
         # Do not pass fps here, as this clock is multi-use
         self.clock = pygame.time.Clock()
+        self.frame_deadline = time.perf_counter()
 
         self.level = None
+        self._event_handlers = {
+            pygame.QUIT: self._on_quit,
+            pygame.VIDEORESIZE: self._on_resize,
+        }
         self.background_color = (0, 255, 0)
         self._layers = {}
+        self._sorted_layers = []
+        self._hit_grid = SpatialHash()
+        self._full_redraw = True
         self.screen_man = ScreenManager()
 
     @property
     def layers(self) -> list[tuple[str, Layer]]:
         """A list of (name, layer) for the engine's render layers in priority sorted order"""
-        return sorted(self._layers.items(), key=lambda item: item[1].priority)
+        return self._sorted_layers
 
     def add_layer(
         self,
@@ -95,10 +245,22 @@ class Engine:
         if name in self._layers:
             raise ValueError("Duplicate layer name")
 
-        if layer is None:
-            layer = pygame.sprite.RenderUpdates()
+        self._layers[name] = Layer(priority, hit_grid=self._hit_grid)
+        # Keep the sorted view up to date here rather than re-sorting every frame
+        bisect.insort(self._sorted_layers, (name, self._layers[name]), key=lambda item: item[1].priority)
 
-        self._layers[name] = Layer(priority=priority, *layer)
+        # Sprites from a caller-supplied group are adopted by the dirty-rect Layer
+        if layer is not None:
+            self.add_sprite(name, *layer)
+
+    def clear_layers(self):
+        """Remove all rendering layers from the display engine."""
+        # Empty the layers, so their components leave the hit grid and no longer refer to them
+        for layer in self._layers.values():
+            layer.empty()
+        self._layers.clear()
+        self._sorted_layers.clear()
+        self._full_redraw = True
 
     def add_sprite(self, layer: str, *sprites: pygame.sprite.DirtySprite):
         """Add a sprite to a render layer."""
@@ -114,36 +276,132 @@ class Engine:
 
         self._layers[layer].remove(*sprites)
 
-    def update(self, events: list[pygame.Event]):
-        """Update all sprites and layers with events that have occurred since last call."""
-        for event in events:
-            self.logger.debug(event)
-            if event.type == pygame.QUIT:
-                self.running = False
-            if event.type == pygame.VIDEORESIZE:
-                window_size = (event.w, event.h)
-                self.logger.info("Updating a window with size %s", window_size)
-                self.display = pygame.display.set_mode(window_size, flags=pygame.RESIZABLE, vsync=self.settings.vsync)
+    def _on_quit(self, event: pygame.event.Event):
+        """Stop the engine when the window is closed."""
+        self.running = False
+
+    def _on_resize(self, event: pygame.event.Event):
+        """Recreate the display when the window is resized."""
+        window_size = (event.w, event.h)
+        self.logger.info("Updating a window with size %s", window_size)
+        self.display = pygame.display.set_mode(window_size, flags=pygame.RESIZABLE, vsync=self.settings.vsync)
+        self._full_redraw = True
+
+    def get_events(self) -> tuple[list[pygame.Event], list[pygame.Event]]:
+        """
+        Get all pending events from the queue, as (engine events, other events).
+
+        If wait_for_events is enabled, this blocks until the next frame is due, collecting events as they arrive.
+        """
+        if not self.settings.wait_for_events:
+            # Let SDL filter out the engine's own events, so sprites never see them.
+            # The first get already pumped the queue, so don't pump it twice per frame.
+            return pygame.event.get(self.ENGINE_EVENT_TYPES), pygame.event.get(pump=False)
+
+        events = pygame.event.get()
+        while (remaining_ms := int((self.frame_deadline - time.perf_counter()) * 1000)) > 0:
+            event = pygame.event.wait(remaining_ms)
+            if event.type == pygame.NOEVENT:
+                break
+            events.append(event)
+
+        engine_events = [event for event in events if event.type in self._event_handlers]
+        other_events = [event for event in events if event.type not in self._event_handlers]
+        return engine_events, other_events
+
+    def update(self, engine_events: list[pygame.Event], events: list[pygame.Event]):
+        """
+        Update all sprites and layers with events that have occurred since last call.
+
+        `engine_events` are the events handled by the engine itself (see ENGINE_EVENT_TYPES),
+        `events` are every other event, which are passed on to the sprites.
+        """
+        # Dragging the window edge can queue many resizes per frame. Only the last one matters,
+        # so the display is recreated and the screen lays itself out once.
+        resize_events = [event for event in engine_events if event.type == pygame.VIDEORESIZE]
+        if len(resize_events) > 1:
+            engine_events = [
+                event for event in engine_events if event.type != pygame.VIDEORESIZE or event is resize_events[-1]
+            ]
+
+        # Bind hot lookups once per frame instead of once per layer or event
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+        for event in engine_events:
+            if debug_enabled:
+                self.logger.debug(event)
+            self._event_handlers[event.type](event)
 
         delta_time = self.clock.tick(self.settings.fps) / 1000  # in seconds
+        self.frame_deadline = time.perf_counter() + 1 / self.settings.fps
 
-        self.screen_man.get_curr_screen().on_event(self, delta_time, events)
+        self.screen_man.get_curr_screen().on_event(self, delta_time, engine_events + events)
 
-        for name, layer in self.layers:
-            self.logger.debug("Updating layer %s", name)
-            layer.update(delta_time, events)
+        # Filter out the events no sprite handles once, rather than in every sprite.
+        # Queue order is kept, so e.g. a press, release and move off a button in one frame still make a click.
+        sprite_event_types = self.SPRITE_EVENT_TYPES
+        sprite_events: SpriteEvents = [event for event in events if event.type in sprite_event_types]
 
-    def draw(self) -> list[pygame.Rect]:
-        """Move all sprites and rerender all layers."""
-        self.display.fill(self.background_color)
+        # Hit test each mouse event once here, instead of in every component
+        query_point = self._hit_grid.query_point
+        for event in sprite_events:
+            if event.type == pygame.MOUSEBUTTONDOWN or event.type == pygame.MOUSEMOTION:
+                event.hits = query_point(event.pos)
 
-        dirty_rects = []
-        for name, layer in self.layers:
-            self.logger.debug("Drawing layer %s", name)
-            dirty_rects.extend(layer.draw(self.display))
+        for name, layer in self._sorted_layers:
+            if debug_enabled:
+                self.logger.debug("Updating layer %s", name)
+            layer.update(delta_time, sprite_events)
 
-        pygame.display.update()
-        return dirty_rects
+    def draw(self) -> list[pygame.Rect]:
+        """Redraw the changed parts of all layers, returning the areas of the display that changed."""
+        # Bind hot lookups once per frame instead of once per layer
+        display = self.display
+        display_rect = display.get_rect()
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+
+        dirty_areas = []
+        if not self._full_redraw:
+            for name, layer in self._sorted_layers:
+                dirty_areas.extend(layer.get_dirty_areas(display_rect))
+            dirty_areas = _merge_rects(dirty_areas)
+
+        # Redraw everything after a resize or screen change, or when most of the display changed anyway
+        if self._full_redraw or sum(rect.w * rect.h for rect in dirty_areas) > display_rect.w * display_rect.h // 2:
+            self._full_redraw = False
+            display.fill(self.background_color)
+            for name, layer in self._sorted_layers:
+                if debug_enabled:
+                    self.logger.debug("Drawing layer %s", name)
+                layer.draw(display)
+            return [display_rect]
+
+        if not dirty_areas:
+            return []
+
+        background_color = self.background_color
+        for area in dirty_areas:
+            display.fill(background_color, area)
+        for name, layer in self._sorted_layers:
+            if debug_enabled:
+                self.logger.debug("Drawing layer %s", name)
+            layer.draw_areas(display, dirty_areas)
+
+        return dirty_areas
+
+    def update_display(self, dirty_rects: list[pygame.Rect]):
+        """
+        Push the changed areas of the display to the screen.
+
+        Flips the whole display instead when there are too many rects, or they cover over half of the display.
+        """
+        display_rect = self.display.get_rect()
+        if (
+            len(dirty_rects) > self.settings.dirty_rect_threshold
+            or sum(rect.w * rect.h for rect in dirty_rects) > display_rect.w * display_rect.h // 2
+        ):
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty_rects)
 
     def set_screen(self, name: str):
         """Set the screen"""
@@ -159,19 +417,19 @@ class Engine:
 
         # First screen init
         self.screen_man.set_screen(init_screen)
-        self._layers.clear()
+        self.clear_layers()
         if self.screen_man.update(self):
-            self.logger.info(f"Updated screen to {repr(self.screen_man.curr_screen)}")
+            self.logger.info("Updated screen to %r", self.screen_man.curr_screen)
 
         while self.running:
-            self.update(pygame.event.get())
+            self.update(*self.get_events())
             dirty_rects = self.draw()
-            pygame.display.update(dirty_rects)
+            self.update_display(dirty_rects)
 
             if self.screen_man.next_screen:
-                self._layers.clear()
+                self.clear_layers()
             if self.screen_man.update(self):
-                self.logger.info(f"Updated screen to {repr(self.screen_man.curr_screen)}")
+                self.logger.info("Updated screen to %r", self.screen_man.curr_screen)
 
         del self.display
         pygame.quit()
@@ -1,21 +1,115 @@
 import abc
-from pathlib import Path
+from collections import OrderedDict, defaultdict
+from typing import Callable, Optional
 
 import numpy as np
 import pygame
 from PIL import Image as PILImage
 
 from main.engine import text_rendering, utils
-from main.image_ops import conv_pil_to_numpy
-from main.type_aliases import ImageArray
+from main.image_ops import IMAGES_DIR, conv_pil_to_numpy
+from main.type_aliases import ImageArray, SpriteEvents
+
+# Finished 9-slice surfaces, keyed by (id(image_array), border, size, scale).
+# Values keep a reference to the source array, so its id cannot be reused while cached.
+_NINE_SLICE_CACHE: OrderedDict[tuple, tuple[ImageArray, pygame.Surface]] = OrderedDict()
+_NINE_SLICE_CACHE_SIZE = 64
+
+
+def _nine_slice_indices(source_size: int, size: int, start_border: int, end_border: int) -> np.ndarray:
+    """
+    The source pixel index of each output pixel along one axis of a 9-slice.
+
+    The borders are copied as is, and the middle is stretched to fill the rest of the size.
+    """
+    middle_indices = utils.nearest_indices(source_size - start_border - end_border, size - start_border - end_border)
+    return np.concatenate((
+        np.arange(start_border),
+        start_border + middle_indices,
+        np.arange(source_size - end_border, source_size),
+    ))
+
+
+class SpatialHash:
+    """A grid of screen cells, to find the components under a point without testing every component."""
+
+    cell_size: int
+    _cells: defaultdict[tuple[int, int], set['BaseComponent']]  # cell: components overlapping it
+    _component_cells: dict['BaseComponent', tuple[int, int, int, int]]  # component: (left, top, right, bottom) cells
+
+    def __init__(self, cell_size: int = 64):
+        self.cell_size = cell_size
+        self._cells = defaultdict(set)
+        self._component_cells = {}
+
+    def _cell_range(self, rect: pygame.Rect) -> tuple[int, int, int, int]:
+        """The inclusive (left, top, right, bottom) range of cells overlapped by a rect."""
+        return (
+            rect.left // self.cell_size,
+            rect.top // self.cell_size,
+            (rect.right - 1) // self.cell_size,
+            (rect.bottom - 1) // self.cell_size,
+        )
+
+    def _add_to_cells(self, component: 'BaseComponent', cell_range: tuple[int, int, int, int]):
+        left, top, right, bottom = cell_range
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                self._cells[x, y].add(component)
+
+    def _remove_from_cells(self, component: 'BaseComponent', cell_range: tuple[int, int, int, int]):
+        left, top, right, bottom = cell_range
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                self._cells[x, y].discard(component)
+
+    def insert(self, component: 'BaseComponent'):
+        """Add a component to the grid."""
+        cell_range = self._cell_range(component.rect)
+        self._component_cells[component] = cell_range
+        self._add_to_cells(component, cell_range)
+
+    def remove(self, component: 'BaseComponent'):
+        """Remove a component from the grid."""
+        cell_range = self._component_cells.pop(component, None)
+        if cell_range is not None:
+            self._remove_from_cells(component, cell_range)
+
+    def move(self, component: 'BaseComponent'):
+        """Update the cells of a component after its rect changed."""
+        old_cell_range = self._component_cells.get(component)
+        new_cell_range = self._cell_range(component.rect)
+        # Moving within the same cells needs no update
+        if old_cell_range == new_cell_range:
+            return
+
+        if old_cell_range is not None:
+            self._remove_from_cells(component, old_cell_range)
+        self._component_cells[component] = new_cell_range
+        self._add_to_cells(component, new_cell_range)
+
+    def query_point(self, pos: tuple[int, int]) -> set['BaseComponent']:
+        """Get the components whose rect contains the (x, y) point."""
+        cell = self._cells.get((pos[0] // self.cell_size, pos[1] // self.cell_size))
+        if not cell:
+            return set()
+        return {component for component in cell if component.rect.collidepoint(pos)}
 
 
 class BaseComponent(abc.ABC, pygame.sprite.DirtySprite):
-    """A sprite that can be drawn by the engine."""
+    """
+    A sprite that can be drawn by the engine.
+
+    The set_* methods mark the component as dirty, so it gets redrawn.
+    Set `dirty = 1` when changing `image` or `rect` directly.
+    """
 
     is_down: bool
     is_hovered: bool
     scale: float
+    # The engine's grid to keep up to date when the rect changes, if added to the engine
+    spatial_hash: Optional[SpatialHash]
+    _event_handlers: dict[int, Callable[[pygame.event.Event], None]]  # event type: handler
 
     def __init__(self):
         super().__init__()
@@ -24,25 +118,32 @@ class BaseComponent(abc.ABC, pygame.sprite.DirtySprite):
 
         self.is_down = False
         self.is_hovered = False
+        self.spatial_hash = None
+        self._event_handlers = {
+            pygame.MOUSEBUTTONDOWN: self._on_mouse_down,
+            pygame.MOUSEMOTION: self._on_mouse_motion,
+            pygame.MOUSEBUTTONUP: self._on_mouse_up,
+            pygame.KEYDOWN: self.on_key_press,
+        }
 
     @property
     def position(self) -> tuple[int, int]:
         """The (x, y) top left position of the component."""
-        return self.rect.x, self.rect.y
+        return self.rect.topleft
 
     @property
     def size(self) -> tuple[int, int]:
         """The (width, height) size of the component."""
-        return self.rect.width, self.rect.height
+        return self.rect.size
 
     @property
     def center(self) -> tuple[int, int]:
         """The (x, y) center position of the component."""
-        return self.position[0] + self.size[0] // 2, self.position[1] + self.size[1] // 2
+        return self.rect.center
 
     @property
     def surface(self) -> ImageArray:
-        """The surface of the component."""
+        """The surface of the component, as a copy of the image's pixels."""
         return utils.make_image_rgba(self.image)
 
     def on_click(self, event: pygame.event.Event):
@@ -63,11 +164,17 @@ class BaseComponent(abc.ABC, pygame.sprite.DirtySprite):
 
     def set_position(self, position: tuple[int, int]):
         """Set the (x, y) top left position of the component."""
-        self.rect.x, self.rect.y = position
+        self.rect.topleft = position
+        self.dirty = 1
+        if self.spatial_hash is not None:
+            self.spatial_hash.move(self)
 
     def set_size(self, size: tuple[int, int]):
         """Set the (width, height) size of the component."""
-        self.rect.width, self.rect.height = size
+        self.rect.size = size
+        self.dirty = 1
+        if self.spatial_hash is not None:
+            self.spatial_hash.move(self)
 
     def set_surface(self, image_array: ImageArray, scale: int = 1, stretch_to_fit: bool = False):
         """
@@ -78,11 +185,22 @@ class BaseComponent(abc.ABC, pygame.sprite.DirtySprite):
         """
         scaled_image_size = image_array.shape[:2][0] * scale, image_array.shape[:2][1] * scale
         if stretch_to_fit:
-            image_array = utils.scale_arr(image_array, self.size)
-        elif len(image_array.shape) != 3 or scaled_image_size != self.size:
+            # Stretch the surface in SDL, rather than going through an array of the stretched size
+            surface = utils.make_surface_rgba(image_array, scale)
+            if self.image.get_size() == self.size and self.image.get_masks() == surface.get_masks():
+                # Stretch into the current image, instead of allocating a new surface on every change
+                pygame.transform.scale(surface, self.size, self.image)
+            else:
+                self.image = pygame.transform.scale(surface, self.size)
+            self.blendmode = 0
+            self.dirty = 1
+            return
+        if len(image_array.shape) != 3 or scaled_image_size != self.size:
             raise ValueError(f"Surface size {scaled_image_size} does not match component size {self.size}.")
 
-        self.image = utils.make_surface_rgba(image_array)
+        self.image = utils.make_surface_rgba(image_array, scale)
+        self.blendmode = 0
+        self.dirty = 1
 
     def set_9_slice_surface(self, image_array: ImageArray, border: tuple[int, int, int, int], scale: int = 1):
         """
@@ -93,44 +211,44 @@ class BaseComponent(abc.ABC, pygame.sprite.DirtySprite):
         The border should be a tuple of (top, right, bottom, left) border sizes.
         It will also scale up the image_array with scale, so make sure image_array.shape * scale == self.size.
         """
-        # Scale the image and border
-        image_array = utils.scale_arr(image_array, scale)
-        border = tuple(b * scale for b in border)
-
-        # Slice with the border of (top, right, bottom, left)
-        top, right, bottom, left = border
-        top_left = image_array[:left, :top]
-        top_right = image_array[-right:, :top]
-        bottom_left = image_array[:left, -bottom:]
-        bottom_right = image_array[-right:, -bottom:]
-        top_center = image_array[left:-right, :top]
-        bottom_center = image_array[left:-right, -bottom:]
-        left_center = image_array[:left, top:-bottom]
-        right_center = image_array[-right:, top:-bottom]
-        center = image_array[left:-right, top:-bottom]
-
-        # Stretch to fit
-        top_center = utils.stretch_arr(top_center, (self.size[0] - left - right, top))
-        bottom_center = utils.stretch_arr(bottom_center, (self.size[0] - left - right, bottom))
-        left_center = utils.stretch_arr(left_center, (left, self.size[1] - top - bottom))
-        right_center = utils.stretch_arr(right_center, (right, self.size[1] - top - bottom))
-        center = utils.stretch_arr(center, (self.size[0] - left - right, self.size[1] - top - bottom))
-
-        # Merge
-        new_image = np.zeros((self.size[0], self.size[1], 4), dtype=np.uint8)
-
-        new_image[:left, :top] = top_left
-        new_image[-right:, :top] = top_right
-        new_image[:left, -bottom:] = bottom_left
-        new_image[-right:, -bottom:] = bottom_right
-        new_image[left:-right, :top] = top_center
-        new_image[left:-right, -bottom:] = bottom_center
-        new_image[:left, top:-bottom] = left_center
-        new_image[-right:, top:-bottom] = right_center
-        new_image[left:-right, top:-bottom] = center
+        cache_key = (id(image_array), tuple(border), self.size, scale)
+        if cache_key in _NINE_SLICE_CACHE:
+            _NINE_SLICE_CACHE.move_to_end(cache_key)
+            # Copy, since the surface may be drawn on afterwards (e.g. by set_text)
+            self.image = _NINE_SLICE_CACHE[cache_key][1].copy()
+            self.blendmode = 0
+            self.dirty = 1
+            return
+        source_array = image_array
+
+        # Slice with the border of (top, right, bottom, left), scaled
+        top, right, bottom, left = (b * scale for b in border)
+        width, height = self.size
+
+        # Map every output pixel to its pixel in the (virtually) scaled source image, then back to the
+        # unscaled image, so scaling, slicing, stretching and merging all happen in one gather
+        x_indices = _nine_slice_indices(image_array.shape[0] * scale, width, left, right) // scale
+        y_indices = _nine_slice_indices(image_array.shape[1] * scale, height, top, bottom) // scale
+        # Gather row by row, the layout SDL reads, so make_surface_rgba can hand it over without a transposing copy
+        new_image = image_array[x_indices, y_indices[:, np.newaxis]].swapaxes(0, 1)
 
         self.set_surface(new_image)
 
+        _NINE_SLICE_CACHE[cache_key] = source_array, self.image.copy()
+        if len(_NINE_SLICE_CACHE) > _NINE_SLICE_CACHE_SIZE:
+            _NINE_SLICE_CACHE.popitem(last=False)
+
+    def premultiply_image(self):
+        """
+        Premultiply the image's colors by its alpha, and draw it with pygame.BLEND_PREMULTIPLIED.
+
+        Premultiplied blits are about twice as fast, but ignore the surface alpha (set_alpha),
+        so only use this for images that are finished and do not fade.
+        """
+        self.image = self.image.premul_alpha()
+        self.blendmode = pygame.BLEND_PREMULTIPLIED
+        self.dirty = 1
+
     def set_text(
         self,
         text: str,
@@ -146,35 +264,47 @@ class BaseComponent(abc.ABC, pygame.sprite.DirtySprite):
             color=color,
             scale=scale,
         )
+        self.dirty = 1
+
+    def _on_mouse_down(self, event: pygame.event.Event):
+        if self in event.hits:
+            self.is_down = True
+
+    def _on_mouse_motion(self, event: pygame.event.Event):
+        is_hit = self in event.hits
+        if self.is_down and not is_hit:
+            self.is_down = False
+
+        if is_hit:
+            if not self.is_hovered:
+                self.is_hovered = True
+                self.on_mouse_enter(event)
+        else:
+            if self.is_hovered:
+                self.is_hovered = False
+                self.on_mouse_leave(event)
+
+    def _on_mouse_up(self, event: pygame.event.Event):
+        if self.is_down:
+            self.is_down = False
+            self.on_click(event)
+
+    def update(self, delta_time: float, events: SpriteEvents):
+        """
+        Update the component.
+
+        `events` are this frame's events of Engine.SPRITE_EVENT_TYPES, in the order they arrived,
+        and mouse press and motion events carry the set of components under the pointer as `event.hits`.
+        """
+        # Nothing happened this frame, which is most frames
+        if not events:
+            return
 
-    def update(self, delta_time: float, events: list[pygame.event.Event]):
-        """Update the component."""
+        event_handlers = self._event_handlers
         for event in events:
-            # mouse click
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if self.rect.collidepoint(event.pos):
-                    self.is_down = True
-            # mouse click release
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if self.is_down:
-                    self.is_down = False
-                    self.on_click(event)
-            # mouse movement
-            elif event.type == pygame.MOUSEMOTION:
-                if self.is_down and not self.rect.collidepoint(event.pos):
-                    self.is_down = False
-
-                if self.rect.collidepoint(event.pos):
-                    if not self.is_hovered:
-                        self.is_hovered = True
-                        self.on_mouse_enter(event)
-                else:
-                    if self.is_hovered:
-                        self.is_hovered = False
-                        self.on_mouse_leave(event)
-            # key press
-            elif event.type == pygame.KEYDOWN:
-                self.on_key_press(event)
+            handler = event_handlers.get(event.type)
+            if handler is not None:
+                handler(event)
 
 
 class Text(BaseComponent):
@@ -207,8 +337,9 @@ class Image(BaseComponent):
         self.rect.move_ip(*position)
 
 
-button_image_path = PILImage.open(Path(__file__).parent.parent / 'data' / 'Images' / 'button.png')
-button_image = utils.add_alpha_to_arr(conv_pil_to_numpy(button_image_path))
+# Decoded once at import. Read-only, since 9-slices of it are cached by the array's id
+with PILImage.open(IMAGES_DIR / 'button.png') as button_png:
+    button_image = conv_pil_to_numpy(button_png.convert("RGBA"))
 
 
 class LabeledButton(BaseComponent):
@@ -253,6 +384,7 @@ class LabeledButton(BaseComponent):
             color=(0, 0, 0),
             scale=self.scale,
         )
+        self.premultiply_image()
 
     def on_click(self, event: pygame.event.Event):
         """Called when the button is clicked."""
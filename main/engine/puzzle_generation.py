@@ -1,91 +1,130 @@
-import itertools
 import random
-from typing import Any, Literal, Optional
+from enum import IntEnum
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
 
 import main.image_ops as image_ops
 from main.type_aliases import TileArray
 
 
+class StepOp(IntEnum):
+    """The image operation of a puzzle step."""
+
+    SWAP = 0
+    FLIP_HORIZONTAL = 1
+    FLIP_VERTICAL = 2
+    ROTATE = 3
+
+
 class Puzzle:
     """Represents an image puzzle and it's solution strategy."""
 
     seed: int
     original_tiles: TileArray
     puzzle_tiles: TileArray
-    # Format: callable, args, kwargs, does not include the required first argument of the tilearray
-    puzzle_to_original: list[tuple[callable, tuple[Any]] | tuple[callable, tuple[Any], dict[str, Any]]]
+    # One step per row, as (StepOp, tile x, tile y, argument 1, argument 2). See apply_step for the arguments
+    puzzle_to_original: npt.NDArray[np.int16]
 
     def __init__(
         self,
         seed: int,
         original_tiles: TileArray,
         puzzle_tiles: TileArray,
-        puzzle_to_original: list,
+        puzzle_to_original: npt.NDArray[np.int16],
     ):
         self.seed = seed
         self.original_tiles = original_tiles
         self.puzzle_tiles = puzzle_tiles
         self.puzzle_to_original = puzzle_to_original
 
+    def apply_step(self, tiles: TileArray, index: int) -> list[tuple[int, int]]:
+        """Apply step `index` of puzzle_to_original to the tiles, returning the indices of the tiles it changed."""
+        op, x, y, arg_1, arg_2 = self.puzzle_to_original[index].tolist()
+        match op:
+            case StepOp.SWAP:
+                # Swap with the tile at (argument 1, argument 2)
+                image_ops.swap_tiles(tiles, (x, y), (arg_1, arg_2))
+                return [(x, y), (arg_1, arg_2)]
+            case StepOp.FLIP_HORIZONTAL:
+                image_ops.flip_tiles(tiles, (x, y), axis='horizontal')
+            case StepOp.FLIP_VERTICAL:
+                image_ops.flip_tiles(tiles, (x, y), axis='vertical')
+            case StepOp.ROTATE:
+                # Rotate by argument 1 degrees
+                image_ops.rotate_tiles(tiles, (x, y), rotation=arg_1)
+        return [(x, y)]
+
 
 def generate_puzzle(
         tiles: TileArray,
         difficulty: int = 1,
         seed: Optional[int] = None,
+        copy_puzzle: bool = False,
 ):
-    """Generate a new scrambled image puzzle from the source image"""
+    """
+    Generate a new scrambled image puzzle from the source image
+
+    The tiles are scrambled in place, and the puzzle's puzzle_tiles is the same array unless copy_puzzle is set.
+    Set it when the tiles will be changed afterwards, but the scrambled state is still needed.
+    """
     if seed is None:
         seed = random.randint(1, 2**64)
 
-    rng = random.Random(seed)
+    rng = np.random.default_rng(seed)
 
     original = tiles.copy()
     # Overwrite original image array
     puzzled = tiles
-    auto_solve_steps = []
+    width, height = tiles.shape[:2]
 
     # Touch each tile at least once
-    difficulty = int(tiles.shape[0] * tiles.shape[1] / 4 * difficulty)
+    difficulty = int(width * height / 4 * difficulty)
 
-    target_tiles = list(itertools.product(range(tiles.shape[0]), range(tiles.shape[1])))
-    target_tiles.extend(
-        (rng.randint(0, puzzled.shape[0]-1), rng.randint(0, puzzled.shape[1]-1))
-        for _ in range(difficulty)
-    )
+    target_tiles = np.concatenate((
+        np.indices((width, height)).reshape(2, -1).T,
+        np.column_stack((rng.integers(0, width, difficulty), rng.integers(0, height, difficulty))),
+    ))
     rng.shuffle(target_tiles)
 
-    for target_tile in target_tiles:
+    # Draw all the randomness for the steps up front, rather than a few calls per step
+    step_total = len(target_tiles)
+    ops = rng.integers(0, 6, step_total)
+    other_tiles = np.column_stack((rng.integers(0, width, step_total), rng.integers(0, height, step_total)))
+    rotations = rng.choice((90, 180, 270), step_total)
 
-        match rng.randint(0, 5):
-            case 0:
-                tile_2_x = rng.randint(0, puzzled.shape[0]-1)
-                tile_2_y = rng.randint(0, puzzled.shape[1]-1)
+    # At most one step per target tile, filled in order
+    auto_solve_steps = np.zeros((step_total, 5), dtype=np.int16)
+    step_count = 0
 
-                image_ops.swap_tiles(puzzled, target_tile, (tile_2_x, tile_2_y))
+    for target_tile, op, other_tile, rotation in zip(
+        map(tuple, target_tiles.tolist()), ops.tolist(), map(tuple, other_tiles.tolist()), rotations.tolist()
+    ):
+        match op:
+            case 0:
+                image_ops.swap_tiles(puzzled, target_tile, other_tile)
 
-                auto_solve_steps.append((image_ops.swap_tiles, ((tile_2_x, tile_2_y), target_tile)))
+                auto_solve_steps[step_count] = StepOp.SWAP, *other_tile, *target_tile
+                step_count += 1
 
             case 1:
                 image_ops.flip_tiles(puzzled, target_tile, axis='horizontal')
-                auto_solve_steps.append(
-                    (image_ops.flip_tiles, (target_tile,), {"axis": "horizontal"})
-                )
+                auto_solve_steps[step_count, :3] = StepOp.FLIP_HORIZONTAL, *target_tile
+                step_count += 1
 
             case 2:
                 image_ops.flip_tiles(puzzled, target_tile, axis='vertical')
-                auto_solve_steps.append(
-                    (image_ops.flip_tiles, (target_tile,), {"axis": "vertical"})
-                )
+                auto_solve_steps[step_count, :3] = StepOp.FLIP_VERTICAL, *target_tile
+                step_count += 1
             case 3:
-                rotation: Literal[90, 180, 270] = rng.choice([90, 180, 270])
                 image_ops.rotate_tiles(puzzled, target_tile, rotation=rotation)
-                auto_solve_steps.append(
-                    (image_ops.rotate_tiles, (target_tile,), {"rotation": 360-rotation})
-                )
+                auto_solve_steps[step_count, :4] = StepOp.ROTATE, *target_tile, 360 - rotation
+                step_count += 1
 
     return Puzzle(
         seed=seed,
         original_tiles=original,
-        puzzle_tiles=puzzled.copy(),
-        puzzle_to_original=list(reversed(auto_solve_steps)),
+        puzzle_tiles=puzzled.copy() if copy_puzzle else puzzled,
+        puzzle_to_original=auto_solve_steps[:step_count][::-1],
     )
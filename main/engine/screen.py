@@ -34,11 +34,13 @@ class ScreenManager:
     screens: dict[str, Screen]
     next_screen: str | None
     curr_screen: str | None
+    _curr_screen_obj: Screen | None  # the screen named curr_screen, looked up once per screen change
 
     def __init__(self):
         self.screens = {}
         self.next_screen = None
         self.curr_screen = None
+        self._curr_screen_obj = None
 
     def add_screen(self, name: str, screen: Screen):
         """Add a screen to the manager."""
@@ -46,9 +48,7 @@ class ScreenManager:
 
     def get_curr_screen(self) -> Screen | None:
         """Get the current screen."""
-        if self.curr_screen:
-            return self.screens[self.curr_screen]
-        return None
+        return self._curr_screen_obj
 
     def set_screen(self, name: str):
         """Set the current screen, actually delayed until end of current loop in engine."""
@@ -61,10 +61,11 @@ class ScreenManager:
         Return true if screen is updated
         """
         if self.next_screen:
-            if self.get_curr_screen():
-                self.get_curr_screen().on_end(engine)
+            if self._curr_screen_obj:
+                self._curr_screen_obj.on_end(engine)
             self.curr_screen = self.next_screen
             self.next_screen = None
-            self.get_curr_screen().on_init(engine)
+            self._curr_screen_obj = self.screens[self.curr_screen]
+            self._curr_screen_obj.on_init(engine)
             return True
         return False
@@ -1,9 +1,10 @@
 import os
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
 
 import numpy as np
 import pygame
-import pygame.locals
 
 from main.data.asciifont import LETTER_ASCII as RAW_LETTER_ASCII
 from main.engine import utils
@@ -21,12 +22,12 @@ for letter, raw_data in RAW_LETTER_ASCII.items():
 
     LETTER_ASCII[letter] = data
 
+# Letter: lines of the letter's ascii art
+LETTER_LINES = {letter: letter_data.split("\n") for letter, letter_data in LETTER_ASCII.items()}
+
 # Letter: (width, height)
 LETTER_DIMENSIONS = {
-    letter: (
-        max(len(i) for i in letter_data.split("\n")),
-        len(letter_data.split("\n")),
-    ) for letter, letter_data in LETTER_ASCII.items()
+    letter: (max(len(line) for line in lines), len(lines)) for letter, lines in LETTER_LINES.items()
 }
 
 LINE_HEIGHT = max(height for letter, (width, height) in LETTER_DIMENSIONS.items())
@@ -35,17 +36,27 @@ LETTER_SPACING = 1
 
 
 LETTER_NDARRAYS = {}
-for letter, letter_data in LETTER_ASCII.items():
+for letter, lines in LETTER_LINES.items():
     LETTER_NDARRAYS[letter] = np.zeros((LETTER_DIMENSIONS[letter][0], LINE_HEIGHT), dtype=np.bool_)
     # if LETTER_DIMENSIONS[letter][1] < LINE_HEIGHT:
     #     y_offset = LINE_HEIGHT - LETTER_DIMENSIONS[letter][1]
     # else:
     #     y_offset = 0
 
-    for y, line in enumerate(letter_data.split("\n"), start=0):
+    for y, line in enumerate(lines, start=0):
         for x, pixel in enumerate(line):
             LETTER_NDARRAYS[letter][x, y] = pixel != " "
 
+# Each letter followed by its spacing, so rendering only has to join these
+LETTER_NDARRAYS_SPACED = {
+    letter: np.concatenate((letter_array, np.zeros((LETTER_SPACING, LINE_HEIGHT), dtype=np.bool_)))
+    for letter, letter_array in LETTER_NDARRAYS.items()
+}
+
+
+# The ascii art character of an off and on pixel
+_ASCII_ART_BYTES = np.frombuffer(b" #", dtype=np.uint8)
+
 
 def render_ascii_art(string: str, max_width: Optional[int] = None) -> str:
     """Render a string into ascii art using our custom font"""
@@ -57,10 +68,11 @@ def render_ascii_art(string: str, max_width: Optional[int] = None) -> str:
     current_width = 0
     letters_to_concatenate = []
     for letter in string:
-        if letter not in LETTER_ASCII:
+        letter_dimensions = LETTER_DIMENSIONS.get(letter)
+        if letter_dimensions is None:
             raise ValueError("Font does not contain character '%s'" % letter)
 
-        letter_width = LETTER_DIMENSIONS[letter][0]
+        letter_width = letter_dimensions[0]
         if letter_width + current_width + LETTER_SPACING < max_width:
             letters_to_concatenate.append(letter)
             current_width += letter_width + LETTER_SPACING
@@ -78,15 +90,46 @@ def render_ascii_art(string: str, max_width: Optional[int] = None) -> str:
 
     output = []
     for text_line in lines:
-        line_out = []
         # To render, we need to read y -> x order. Data is stored in x -> y order.
-        for terminal_line in text_line.swapaxes(0, 1):
-            line_out.append(''.join(" #"[bool(i)] for i in terminal_line))
-        output.append("\n".join(line_out))
+        # Map every pixel to its character byte at once, then decode each row
+        line_bytes = _ASCII_ART_BYTES[text_line.swapaxes(0, 1).view(np.uint8)]
+        output.append("\n".join(row.tobytes().decode("ascii") for row in line_bytes))
 
     return ("\n"*(LINE_SPACING + 1)).join(output)
 
 
+# Rendered text surfaces, keyed by (text, color, scale)
+_RENDERED_TEXT_CACHE: OrderedDict[tuple[str, tuple[int, int, int], int], pygame.Surface] = OrderedDict()
+_RENDERED_TEXT_CACHE_SIZE = 512
+
+
+def _render_text_surface(text: str, color: tuple[int, int, int], scale: int) -> pygame.Surface:
+    """Render text onto a new transparent surface, cached by (text, color, scale). Do not modify the result."""
+    cache_key = (text, tuple(color), scale)
+    if cache_key in _RENDERED_TEXT_CACHE:
+        _RENDERED_TEXT_CACHE.move_to_end(cache_key)
+        return _RENDERED_TEXT_CACHE[cache_key]
+
+    # TODO: generalize text wrapping
+    rendered_array = render_letters(list(text))
+
+    if scale != 1:
+        rendered_array = utils.scale_arr(rendered_array, scale)
+
+    # Draw the text in opaque color according to the mask, writing all four channels in one pass.
+    # Fill it row by row (y, x), the layout SDL reads, so make_surface_rgba does not need to transpose it.
+    pixels = np.zeros((rendered_array.shape[1], rendered_array.shape[0], 4), dtype=np.uint8)
+    pixels[rendered_array.T] = (*color, 255)
+    # Also converts to the display's pixel format, so blitting the text (or a Text component's copy) is fast
+    surface = utils.make_surface_rgba(pixels.swapaxes(0, 1))
+
+    _RENDERED_TEXT_CACHE[cache_key] = surface
+    if len(_RENDERED_TEXT_CACHE) > _RENDERED_TEXT_CACHE_SIZE:
+        _RENDERED_TEXT_CACHE.popitem(last=False)
+
+    return surface
+
+
 def render_on_surface(
     letters: str,
     surface: pygame.Surface,
@@ -94,80 +137,47 @@ def render_on_surface(
     color: tuple[int, int, int] = (255, 0, 255),
     scale: int = 1,
 ):
-    """Render a string of text onto the provided pygame surface using our ascii font and numpy"""
-    # TODO: generalize text wrapping
-    rendered_array = render_letters(list(letters))
+    """Render a string of text onto the provided pygame surface using our ascii font"""
+    text_surface = _render_text_surface(letters, color, scale)
+    text_size = text_surface.get_size()
 
-    if scale != 1:
-        rendered_array = np.repeat(np.repeat(rendered_array, scale, 1), scale, 0)
-
-    surface_array = pygame.surfarray.pixels3d(surface)
-    # expand our render mask to have a replicated "color" dimension
-    render_mask = np.expand_dims(rendered_array, 2)
-    # Replicate color across a 3d array of where we'll be rendering
-    color_base = np.broadcast_to(np.array(color, dtype=np.uint8), (*rendered_array.shape, surface_array.shape[-1]))
-    # AND with mask to do the drawing
-    rendered_font_image_array = color_base * render_mask
-
-    if rendered_array.shape[0] > surface_array.shape[0]:
+    if text_size[0] > surface.get_width():
         raise ValueError("Cannot render text: destination surface is not wide enough: %s < %s"
-                         % (surface_array.shape[0], rendered_array.shape[0]))
-    if rendered_array.shape[1] > surface_array.shape[1]:
+                         % (surface.get_width(), text_size[0]))
+    if text_size[1] > surface.get_height():
         raise ValueError("Cannot render text: destination surface is not tall enough: %s < %s"
-                         % (surface_array.shape[1], rendered_array.shape[1]))
-
-    # Paste drawn text onto the destination surface
-    np.copyto(
-        surface_array[
-            coords[0]:coords[0]+rendered_array.shape[0],
-            coords[1]:coords[1]+rendered_array.shape[1],
-            :
-        ],
-        rendered_font_image_array,
-        where=render_mask,
-    )
-    del surface_array
-    # update per-pixel alphas too
-    # this is done separately in pygame for some reason
-    # We don't do blending for the moment. Set to opaque according to mask.
-    alphas_array = pygame.surfarray.pixels_alpha(surface)
-    np.copyto(
-        alphas_array[
-            coords[0]:coords[0] + rendered_array.shape[0],
-            coords[1]:coords[1] + rendered_array.shape[1],
-        ],
-        255,
-        where=rendered_array,
-    )
-
-    return pygame.Rect(*coords, *rendered_array.shape)
+                         % (surface.get_height(), text_size[1]))
+
+    # The text surface is fully transparent or fully opaque, so blending it on
+    # only overwrites the text pixels with its color, and sets them to opaque.
+    surface.blit(text_surface, coords)
+
+    return pygame.Rect(*coords, *text_size)
 
 
 def render_to_surface(text: str, color: tuple[int, int, int] = (255, 0, 255), scale: int = 1) -> pygame.Surface:
     """Render a given string onto a new pygame surface using our ascii font"""
-    rendered_array = render_letters(text)
-    surface = pygame.Surface((rendered_array.shape[0]*scale, rendered_array.shape[1]*scale), pygame.locals.SRCALPHA)
-    render_on_surface(text, surface, color=color, scale=scale)
-    return surface
+    # Copy, as the caller may modify the surface
+    return _render_text_surface(text, color, scale).copy()
 
 
 def render_to_image_array(text: str, color: tuple[int, int, int] = (255, 0, 255), scale: int = 1) -> ImageArray:
     """Render a given string onto a new image array using our ascii font"""
-    surface = render_to_surface(text, color=color, scale=scale)
-    return pygame.surfarray.pixels3d(surface)
+    rendered_array = render_letters(list(text))
+    if scale != 1:
+        rendered_array = utils.scale_arr(rendered_array, scale)
+
+    image_array = np.zeros((*rendered_array.shape, 3), dtype=np.uint8)
+    image_array[rendered_array] = color
+    return image_array
 
 
 def render_letters(letters: list[str]) -> np.ndarray:
     """Render a list of letters to a numpy array of bool pixels."""
-    spacing_array = np.zeros((LETTER_SPACING, LINE_HEIGHT), dtype=np.bool_)
-
-    letter_arrays = list(utils.flatten((LETTER_NDARRAYS[letter], spacing_array) for letter in letters))
-
-    render_array = np.concatenate(letter_arrays, axis=0, dtype=np.bool_)
-
-    return render_array
+    return np.concatenate([LETTER_NDARRAYS_SPACED[letter] for letter in letters], axis=0, dtype=np.bool_)
 
 
+@lru_cache(maxsize=512)
 def width_of_rendered_text(text: str, scale: int = 1) -> int:
     """Compute the width in dots that a given string will render with"""
     return (sum(LETTER_NDARRAYS[i].shape[0] for i in text) + LETTER_SPACING * len(text)) * scale
@@ -13,19 +13,17 @@ def make_surface_rgba(array: ImageArray, scale: int = 1) -> pygame.Surface:
     if len(shape) != 3 or shape[2] not in (3, 4):
         raise ValueError("Array must be (w, h, 3 or 4) numpy array.")
 
-    scale_arr(array, scale)
+    if scale != 1:
+        array = scale_arr(array, scale)
 
-    # Create a surface the same width and height as array and with per-pixel alpha.
-    surface = pygame.Surface(array.shape[0:2], pygame.SRCALPHA, 32)
+    # SDL reads pixels row by row, so lay the array out as contiguous (h, w, 4) bytes
+    pixels = np.ascontiguousarray(arr2d_swap_xy(add_alpha_to_arr(array)))
+    surface = pygame.image.frombuffer(pixels, array.shape[:2], "RGBA")
 
-    # Copy the rgb part of array to the new surface.
-    pygame.pixelcopy.array_to_surface(surface, array[:, :, :3])
-
-    # Copy the alpha part of array to the surface using a pixels-alpha view of the surface.
-    surface_alpha = np.array(surface.get_view('A'), copy=False)
-    surface_alpha[:, :] = array[:, :, 3] if array.shape[-1] == 4 else 255
-
-    return surface
+    # The surface shares memory with pixels, so make our own copy in the display's format for fast blits
+    if pygame.display.get_surface() is None:
+        return surface.copy()
+    return surface.convert_alpha()
 
 
 def make_image_rgba(surface: pygame.Surface) -> ImageArray:
@@ -54,15 +52,18 @@ def merge_images(top: ImageArray, bottom: ImageArray) -> ImageArray:
     if top.shape != bottom.shape:
         raise ValueError("Images must be the same shape.")
 
-    alpha_bottom = bottom[:, :, 3] / 255.0
-    alpha_top = top[:, :, 3] / 255.0
+    # Fixed point in 0-255 rather than floats in 0-1. Products of two 0-255 values fit in 16 bits,
+    # and alpha_top + weight_bottom <= 255, so the color sums below do too.
+    alpha_top = top[:, :, 3].astype(np.uint16)
+    # How much of the bottom shows through the top, shared by every channel
+    weight_bottom = bottom[:, :, 3] * (255 - alpha_top) // 255
 
-    new_image = bottom.copy()
+    new_image = np.empty_like(bottom)
 
     for color in range(3):
-        new_image[:, :, color] = alpha_top[:, :] * top[:, :, color]\
-            + alpha_bottom * bottom[:, :, color] * (1 - alpha_top)
-    new_image[:, :, 3] = (1 - (1 - alpha_top) * (1 - alpha_bottom)) * 255
+        new_image[:, :, color] = (alpha_top * top[:, :, color] + weight_bottom * bottom[:, :, color]) // 255
+    # Same as 255 - (255 - alpha_top) * (255 - alpha_bottom) / 255
+    new_image[:, :, 3] = alpha_top + weight_bottom
 
     return new_image
 
@@ -84,7 +85,12 @@ def flatten(iterable: Iterable[Iterable]) -> Iterable:
 
 def scale_arr(array: ImageArray, scale: int) -> ImageArray:
     """Scales an array uniformly on x y axis by a given factor."""
-    return np.repeat(np.repeat(array, scale, axis=0), scale, axis=1)
+    width, height, *channels = array.shape
+    # Repeat along y, then broadcast each of those columns scale times along x straight into the result.
+    # The only intermediate is 1/scale of the result's size, unlike repeating along both axes.
+    scaled = np.empty((width, scale, height * scale, *channels), dtype=array.dtype)
+    scaled[:] = np.repeat(array, scale, axis=1)[:, np.newaxis]
+    return scaled.reshape(width * scale, height * scale, *channels)
 
 
 def stretch_arr(array: ImageArray, new_size: tuple[int, int]) -> ImageArray:
@@ -93,10 +99,25 @@ def stretch_arr(array: ImageArray, new_size: tuple[int, int]) -> ImageArray:
 
     The new size should be a tuple of (width, height).
     """
-    # Kind of a cheat by using pygame
-    surface = make_surface_rgba(array)
-    surface = pygame.transform.scale(surface, new_size)
-    return make_image_rgba(surface)
+    width, height = array.shape[:2]
+    scale = new_size[0] // width
+    if (width * scale, height * scale) == tuple(new_size):
+        return scale_arr(array, scale)
+
+    # Sample the same pixels as pygame.transform.scale, without a round trip through surfaces
+    return array[nearest_indices(width, new_size[0])[:, np.newaxis], nearest_indices(height, new_size[1])]
+
+
+def nearest_indices(source_size: int, size: int) -> np.ndarray:
+    """
+    The source index of each pixel when stretching source_size pixels to size pixels with nearest neighbour.
+
+    This samples the same pixels as SDL's (and so pygame.transform.scale's) nearest neighbour stretch.
+    """
+    if size <= 0:
+        return np.arange(0)
+    step = (source_size << 16) // size
+    return (step // 2 + np.arange(size) * step) >> 16
 
 
 def outline_rectangle(size: tuple[int, int], color: tuple[int, int, int, int], width: int = 1) -> ImageArray:
@@ -118,7 +139,10 @@ def outline_rectangle(size: tuple[int, int], color: tuple[int, int, int, int], w
 def add_alpha_to_arr(image_array: ImageArray) -> ImageArray:
     """Add an alpha channel to an image array, if it does not already have one."""
     if image_array.shape[-1] == 3:
-        alpha = np.full(image_array.shape[:-1] + (1,), 255, dtype=np.uint8)
-        image_array = np.concatenate((image_array, alpha), axis=-1)
+        # Allocate the result once and fill it, rather than concatenating with a separate alpha array
+        rgba_array = np.empty(image_array.shape[:-1] + (4,), dtype=np.uint8)
+        rgba_array[..., :3] = image_array
+        rgba_array[..., 3] = 255
+        return rgba_array
 
     return image_array
@@ -1,3 +1,5 @@
+from functools import lru_cache
+from pathlib import Path
 from typing import Literal
 
 import numpy as np
@@ -5,16 +7,34 @@ from PIL import Image
 
 from .type_aliases import ImageArray, TileArray
 
+# Where the game's images are stored
+IMAGES_DIR = Path(__file__).parent / 'data' / 'Images'
+
 
 def conv_pil_to_numpy(img: Image) -> ImageArray:
-    """Convert pillow image to a numpy array of (width, height)"""
-    return np.array(img).swapaxes(0, 1)
+    """Convert pillow image to a read-only numpy array of (width, height)"""
+    return np.asarray(img).swapaxes(0, 1)
+
+
+def load_image_array(path: Path | str) -> ImageArray:
+    """Decode an image in data/Images to a read-only RGBA array, cached as screens load it on every visit."""
+    # Cache by Path, so 'a.png' and Path('a.png') share one entry
+    return _load_image_array(Path(path))
+
+
+@lru_cache(maxsize=16)
+def _load_image_array(path: Path) -> ImageArray:
+    with Image.open(IMAGES_DIR / path) as image:
+        return conv_pil_to_numpy(image.convert("RGBA"))
 
 
 def conv_img_arr_to_tile(image_arr: ImageArray, tile_size: int) -> TileArray:
     """
     Converts an image array into an array of tiles for image operations
 
+    The tiles are a view of the image array, so operations on the tiles change the image too.
+    Splitting each axis in two never needs a copy, whatever the image array's strides are.
+
     Note: Tiles should be square
     """
     width, height, channel_count = image_arr.shape
@@ -40,6 +60,11 @@ def rotate_tiles(
 
     Tile positions are given by (row index, column index)
     """
+    if len(tile_pos) == 1:
+        # A single tile is a view, so this skips fancy indexing's gather and scatter copies
+        tile_arr[tile_pos[0]] = np.rot90(tile_arr[tile_pos[0]], k=rotation // 90)
+        return
+
     *indices, = zip(*tile_pos)
     # tile_arr[*indices] is an array of tiles,
     # so axes=(1, 2) ensures that the tiles are being rotated
@@ -56,6 +81,11 @@ def flip_tiles(
 
     Tile positions are given by (row index, column index)
     """
+    if len(tile_pos) == 1:
+        # A single tile is a view, so this skips fancy indexing's gather and scatter copies
+        tile_arr[tile_pos[0]] = np.flip(tile_arr[tile_pos[0]], axis=0 if axis == 'vertical' else 1)
+        return
+
     *indices, = zip(*tile_pos)
     tile_arr[*indices] = np.flip(tile_arr[*indices], axis=1 if axis == 'vertical' else 2)
 
@@ -86,16 +116,17 @@ def apply_filter_to_tiles(
     if grayscale:
         # this ignores the filter color and strength
         *indices, = zip(*tile_pos)
-        tile_arr[*indices] = np.mean(tile_arr[*indices], axis=3, keepdims=True)
+        tiles = tile_arr[*indices].astype(np.uint16)
+        # ITU-R BT.601 luma in 8 bit fixed point, the weights sum to 256 so this fits in 16 bits
+        gray = (77 * tiles[..., 0] + 150 * tiles[..., 1] + 29 * tiles[..., 2]) >> 8
+        # Leave any alpha channel alone
+        tile_arr[*indices, ..., :3] = gray[..., np.newaxis]
         return
 
-    # Im going for iteration here for readability
-    for pos in tile_pos:
-        tile = tile_arr[pos]
-
-        filtered_tile = tile + (np.array(filter_color) * filter_strength)
-        filtered_tile = np.clip(filtered_tile, 0, 255)
-        tile_arr[pos] = filtered_tile
+    # Filter all the tiles at once, leaving any alpha channel alone
+    *indices, = zip(*tile_pos)
+    filtered_tiles = tile_arr[*indices, ..., :3] + np.array(filter_color) * filter_strength
+    tile_arr[*indices, ..., :3] = np.clip(filtered_tiles, 0, 255)
 
 
 if __name__ == '__main__':
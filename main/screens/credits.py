@@ -2,7 +2,7 @@ import logging
 
 import pygame
 
-from main.engine import Engine, Screen, components
+from main.engine import Engine, Screen, components, text_rendering
 
 
 class BackButton(components.LabeledButton):
@@ -19,10 +19,32 @@ class BackButton(components.LabeledButton):
         self.engine.set_screen("main_menu")
 
 
+class CreditsText(components.BaseComponent):
+    """The credit lines, centered in a vertical stack and pre-rendered onto one surface."""
+
+    def __init__(self, text: str, line_margin: int, color: tuple[int, int, int] = (255, 0, 255), scale: int = 1):
+        super().__init__()
+
+        lines = [line.strip() for line in text.upper().splitlines()[1:]]
+        line_height = text_rendering.height_of_rendered_text("", scale)
+        line_step = line_height + line_margin * scale
+        width = max(text_rendering.width_of_rendered_text(line, scale) for line in lines)
+        height = line_step * len(lines) - line_margin * scale
+
+        text_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        for i, line in enumerate(lines):
+            if line:
+                line_x = width // 2 - text_rendering.width_of_rendered_text(line, scale) // 2
+                text_rendering.render_on_surface(line, text_surface, (line_x, i * line_step), color, scale)
+
+        self.image = text_surface.convert_alpha()
+        self.rect = self.image.get_rect()
+
+
 class CreditsScreen(Screen):
     """The credits screen"""
 
-    credits_texts: list[components.Text | None]
+    credits_text: CreditsText
 
     SCALE: int = 3
     TEXT: str = """
@@ -48,24 +70,11 @@ class CreditsScreen(Screen):
         engine.background_color = (240, 240, 240)
 
         # Credits
-        engine.add_layer("credits", pygame.sprite.RenderUpdates())
-        engine.add_layer("buttons", pygame.sprite.RenderUpdates())
-
-        self.credits_texts = []
-        for line in self.TEXT.upper().splitlines()[1:]:
-            line = line.strip()
-            if line == "":
-                self.credits_texts.append(None)
-                continue
-
-            self.credits_texts.append(
-                components.Text(
-                    line,
-                    scale=self.SCALE,
-                    color=(0, 0, 0),
-                )
-            )
-            engine.add_sprite("credits", self.credits_texts[-1])
+        engine.add_layer("credits")
+        engine.add_layer("buttons")
+
+        self.credits_text = CreditsText(self.TEXT, self.TEXT_MARGIN, scale=self.SCALE, color=(0, 0, 0))
+        engine.add_sprite("credits", self.credits_text)
 
         self.back_button = BackButton(engine, scale=self.SCALE)
         engine.add_sprite("buttons", self.back_button)
@@ -90,26 +99,15 @@ class CreditsScreen(Screen):
 
         Specifications:
         - credit texts are centered in a vertical stack, with a 4px margin between them.
+          The stack is pre-rendered as a single sprite, so it is simply centered.
         """
         margin = self.TEXT_MARGIN * self.SCALE
 
         # Credits
-        text_height = sum(
-            text.size[1] if text is not None else self.credits_texts[0].size[1]
-            for text in self.credits_texts
-        ) + margin * (len(self.credits_texts) - 1)
-
-        # Center the text
-        center_x = size[0] // 2
-        text_y = (size[1] - text_height) // 2
-
-        for text in self.credits_texts:
-            if text is not None:
-                text_x = center_x - text.size[0] // 2
-                text.set_position((text_x, text_y))
-                text_y += text.size[1] + margin
-            else:
-                text_y += self.credits_texts[0].size[1] + margin
+        self.credits_text.set_position((
+            size[0] // 2 - self.credits_text.size[0] // 2,
+            (size[1] - self.credits_text.size[1]) // 2,
+        ))
 
         # Back button
         self.back_button.set_position((margin, margin))
@@ -4,7 +4,6 @@ from typing import Optional
 
 import numpy as np
 import pygame
-from PIL import Image
 from pydantic import BaseModel
 
 from main import image_ops
@@ -13,8 +12,8 @@ from main.engine.puzzle_generation import Puzzle, generate_puzzle
 from main.engine.text_rendering import (
     height_of_rendered_text, width_of_rendered_text
 )
-from main.image_ops import conv_img_arr_to_tile, conv_pil_to_numpy
-from main.type_aliases import ImageArray, TileArray
+from main.image_ops import conv_img_arr_to_tile, load_image_array
+from main.type_aliases import ImageArray, SpriteEvents, TileArray
 
 
 class ScrambleConfig(BaseModel):
@@ -37,19 +36,40 @@ class ScrambledImage(components.BaseComponent):
     fit_size: tuple[int, int]
 
     image_array: ImageArray
-    select_array: ImageArray
+    outline_array: ImageArray  # the selection outline of a single tile
+    # The image stretched to fit_size without the outline, and where the outline is drawn over it
+    _stretched_base: Optional[pygame.Surface] = None
+    _outline_rect: Optional[pygame.Rect] = None
+    # fit_size, and the source x and y index of each pixel of the image stretched to it
+    _stretch_indices: Optional[tuple[tuple[int, int], np.ndarray, np.ndarray]] = None
+    # Set when the selection moved, so that the outline is redrawn once per frame however many times it moved
+    _selection_moved: bool = False
+
+    # Arrow key: (x, y) step of the selected tile
+    ARROW_KEY_STEPS: dict[int, tuple[int, int]] = {
+        pygame.K_LEFT: (-1, 0),
+        pygame.K_RIGHT: (1, 0),
+        pygame.K_UP: (0, -1),
+        pygame.K_DOWN: (0, 1),
+    }
 
     def __init__(self, scramble_config: ScrambleConfig):
         super().__init__()
 
         self.config = scramble_config
 
-        # Open image array
-        logo_png = Image.open(Path(__file__).parent.parent / 'data' / 'Images' / scramble_config.path)
-        self.image_array = utils.add_alpha_to_arr(conv_pil_to_numpy(logo_png))
+        # Open image array. Copy the cached image, as the tiles are moved around in place.
+        # Keep its memory layout, which is already the row by row order SDL reads.
+        self.image_array = load_image_array(scramble_config.path).copy(order='K')
         self.fit_size = self.image_array.shape[:2]
 
         self.tile_arr = conv_img_arr_to_tile(self.image_array, self.config.tile_size)
+        # The outline never changes, so only draw it once
+        self.outline_array = utils.outline_rectangle(
+            (self.config.tile_size, self.config.tile_size),
+            self.config.outline_color,
+            self.config.outline_thickness,
+        )
         self.prev_tile = (0, 0)
         self.selected_tile = (0, 0)
 
@@ -62,27 +82,21 @@ class ScrambledImage(components.BaseComponent):
         local_pos = event.pos[0] - self.position[0], event.pos[1] - self.position[1]
 
         self.logger.debug(f"Clicked tile at local pos {local_pos}")
+        # Clicking the selected tile again still makes it the previous tile, for swapping
         self.prev_tile = self.selected_tile
         self.selected_tile = self.get_tile_index(local_pos)
         self.logger.debug(f"Selected tile is {self.selected_tile}")
-        self.update_surface()
+        if self.selected_tile != self.prev_tile:
+            self._selection_moved = True
 
     def on_key_press(self, event: pygame.event.Event):
         """Tile selection with arrow keys."""
-        new_selected_tile = self.selected_tile
-
-        if event.key == pygame.K_LEFT:
-            self.logger.debug("Pressed LEFT key")
-            new_selected_tile = (self.selected_tile[0] - 1, self.selected_tile[1])
-        elif event.key == pygame.K_RIGHT:
-            self.logger.debug("Pressed RIGHT key")
-            new_selected_tile = (self.selected_tile[0] + 1, self.selected_tile[1])
-        elif event.key == pygame.K_UP:
-            self.logger.debug("Pressed UP key")
-            new_selected_tile = (self.selected_tile[0], self.selected_tile[1] - 1)
-        elif event.key == pygame.K_DOWN:
-            self.logger.debug("Pressed DOWN key")
-            new_selected_tile = (self.selected_tile[0], self.selected_tile[1] + 1)
+        step = self.ARROW_KEY_STEPS.get(event.key)
+        if step is None:
+            return
+
+        self.logger.debug(f"Pressed {pygame.key.name(event.key).upper()} key")
+        new_selected_tile = (self.selected_tile[0] + step[0], self.selected_tile[1] + step[1])
 
         # image operations
         # q key
@@ -96,40 +110,139 @@ class ScrambledImage(components.BaseComponent):
         #     image_ops.rotate_tiles(self.scrambled_image.tile_arr, self.scrambled_image.selected_tile)
         #     self.scrambled_image.update_surface()
 
-        if not np.allclose(new_selected_tile, self.selected_tile):
-            # Check if the new selected tile is within bounds
-            rows, cols = self.image_array.shape[:2]
-            new_selected_tile = (
-                np.clip(new_selected_tile[0], 0, (rows // self.config.tile_size) - 1),
-                np.clip(new_selected_tile[1], 0, (cols // self.config.tile_size) - 1)
-            )
+        # Keep the new selected tile within bounds
+        rows, cols = self.tile_arr.shape[:2]
+        new_selected_tile = (
+            min(max(new_selected_tile[0], 0), rows - 1),
+            min(max(new_selected_tile[1], 0), cols - 1),
+        )
 
+        # Nothing to redraw when moving against an edge
+        if new_selected_tile != self.selected_tile:
             self.logger.debug(f"New selected tile: {new_selected_tile}")
 
             self.selected_tile = new_selected_tile
-            self.update_surface()
+            self._selection_moved = True
+
+    def update(self, delta_time: float, events: SpriteEvents):
+        """Handle input, then redraw the outline if the selection moved."""
+        super().update(delta_time, events)
+
+        if self._selection_moved:
+            self._selection_moved = False
+            self.update_surface(tiles_changed=False)
 
     def get_tile_index(self, pos: tuple[int, int]) -> tuple[int, int]:
         """Get the index of the tile at the given local position."""
+        # Exact integer math, rather than going through a float ratio
         return (
-            int(pos[0] / self.fit_size[0] * self.image_array.shape[0]) // self.config.tile_size,
-            int(pos[1] / self.fit_size[1] * self.image_array.shape[1]) // self.config.tile_size,
+            pos[0] * self.image_array.shape[0] // (self.fit_size[0] * self.config.tile_size),
+            pos[1] * self.image_array.shape[1] // (self.fit_size[1] * self.config.tile_size),
         )
 
-    def update_surface(self):
-        """Rerender the surface."""
-        self.select_array = np.zeros(self.image_array.shape, dtype=np.uint8)
-        position = self.selected_tile[0] * self.config.tile_size, self.selected_tile[1] * self.config.tile_size
-        size = self.config.tile_size, self.config.tile_size
+    def update_surface(self, tiles_changed: bool = True):
+        """
+        Rerender the surface.
 
-        # Create the outline rectangle
-        rect = utils.outline_rectangle(size, self.config.outline_color, self.config.outline_thickness)
-        self.select_array[position[0]:position[0] + size[0], position[1]:position[1] + size[1]] = rect
+        If only the selection moved, pass tiles_changed=False to reuse the stretched image
+        and only redraw the tiles the outline moved between.
+        """
+        if tiles_changed or self._stretched_base is None or self._stretched_base.get_size() != self.fit_size:
+            self.set_size(self.fit_size)
+            self.set_surface(self.image_array, stretch_to_fit=True)
+            self._stretched_base = self.image.copy()
+        elif self._outline_rect is not None:
+            # Put the pixels without the outline back
+            self.copy_from_base(self._outline_rect)
+
+        self.draw_outline()
+        self.dirty = 1
+
+    def update_tiles(self, *tiles: tuple[int, int]):
+        """Rerender the surface after an image operation that only changed the given tiles."""
+        if self._stretched_base is None or self._stretched_base.get_size() != self.fit_size:
+            self.update_surface()
+            return
+
+        for tile in tiles:
+            tile_rect = self.stretch_tile(self.tile_pixels(tile), tile, self._stretched_base)
+            self.copy_from_base(tile_rect)
+        self.update_surface(tiles_changed=False)
+
+    def draw_outline(self):
+        """Draw the selected tile with its outline over the stretched image."""
+        if self.config.outline_color[3] != 255:
+            # A translucent outline has to be blended with the tile's pixels. Blending premultiplies the
+            # colors by alpha, so keep the tile's straight alpha pixels as they are where there is no outline.
+            tile_pixels = self.tile_pixels(self.selected_tile)
+            outlined_tile = np.where(
+                self.outline_array[:, :, 3:] == 0,
+                tile_pixels,
+                utils.merge_images(self.outline_array, tile_pixels),
+            )
+            self._outline_rect = self.stretch_tile(outlined_tile, self.selected_tile, self.image)
+            return
+
+        # An opaque outline replaces the pixels under it, and the tile itself is already drawn,
+        # so only fill in the stretched edges of the outline
+        tile_rect, x_indices, y_indices = self.stretched_tile_area(self.selected_tile)
+        thickness, inner_end = self.config.outline_thickness, self.config.tile_size - self.config.outline_thickness
+        left, right = np.count_nonzero(x_indices < thickness), np.count_nonzero(x_indices >= inner_end)
+        top, bottom = np.count_nonzero(y_indices < thickness), np.count_nonzero(y_indices >= inner_end)
+
+        color = self.config.outline_color
+        self.image.fill(color, (tile_rect.left, tile_rect.top, tile_rect.width, top))
+        self.image.fill(color, (tile_rect.left, tile_rect.bottom - bottom, tile_rect.width, bottom))
+        self.image.fill(color, (tile_rect.left, tile_rect.top, left, tile_rect.height))
+        self.image.fill(color, (tile_rect.right - right, tile_rect.top, right, tile_rect.height))
+        self._outline_rect = tile_rect
+
+    def tile_pixels(self, tile: tuple[int, int]) -> ImageArray:
+        """The (tile_size, tile_size, 4) pixels of a tile, as a view of the image array."""
+        tile_size = self.config.tile_size
+        x, y = tile[0] * tile_size, tile[1] * tile_size
+        return self.image_array[x:x + tile_size, y:y + tile_size]
+
+    def stretched_tile_area(self, tile: tuple[int, int]) -> tuple[pygame.Rect, np.ndarray, np.ndarray]:
+        """
+        The area of a tile in the image stretched to fit_size, and the tile pixels sampled for it.
+
+        The pixels are given as the x index within the tile of each column of the area, and the y index
+        of each row. They are the same pixels that stretching the whole image samples.
+        """
+        tile_size = self.config.tile_size
+        x, y = tile[0] * tile_size, tile[1] * tile_size
+        x_indices, y_indices = self.stretch_indices()
+        left, right = np.searchsorted(x_indices, (x, x + tile_size))
+        top, bottom = np.searchsorted(y_indices, (y, y + tile_size))
+        tile_rect = pygame.Rect(left, top, right - left, bottom - top)
+        return tile_rect, x_indices[left:right] - x, y_indices[top:bottom] - y
+
+    def stretch_tile(self, tile_pixels: ImageArray, tile: tuple[int, int], surface: pygame.Surface) -> pygame.Rect:
+        """Stretch pixels over the area of a tile in a surface of fit_size, overwriting it. Returns the area."""
+        tile_rect, x_indices, y_indices = self.stretched_tile_area(tile)
+        if tile_rect.width == 0 or tile_rect.height == 0:
+            return tile_rect
+
+        stretched_tile = tile_pixels[x_indices[:, np.newaxis], y_indices]
+        pygame.transform.scale(utils.make_surface_rgba(stretched_tile), tile_rect.size, surface.subsurface(tile_rect))
+        return tile_rect
+
+    def stretch_indices(self) -> tuple[np.ndarray, np.ndarray]:
+        """The source x and y index of each pixel when stretching the image to fit_size."""
+        if self._stretch_indices is None or self._stretch_indices[0] != self.fit_size:
+            self._stretch_indices = (
+                self.fit_size,
+                utils.nearest_indices(self.image_array.shape[0], self.fit_size[0]),
+                utils.nearest_indices(self.image_array.shape[1], self.fit_size[1]),
+            )
+        return self._stretch_indices[1:]
 
-        actual_image = utils.merge_images(self.select_array, self.image_array)
-        actual_image = utils.stretch_arr(actual_image, self.fit_size)
-        self.set_size(self.fit_size)
-        self.set_surface(actual_image)
+    def copy_from_base(self, rect: pygame.Rect):
+        """Copy an area of the stretched image without the outline into the surface, rather than blending it on."""
+        if rect.width == 0 or rect.height == 0:
+            return
+        pygame.transform.scale(self._stretched_base.subsurface(rect), rect.size, self.image.subsurface(rect))
 
 
 class ImageOpButton(components.LabeledButton):
@@ -160,15 +273,15 @@ class FlipButton(ImageOpButton):
     def on_click(self, event: pygame.event.Event):
         """Called when the button is clicked."""
         image_ops.flip_tiles(self.scrambled_image.tile_arr, self.scrambled_image.selected_tile)
-        self.scrambled_image.update_surface()
-        self.game.check_victory()
+        self.scrambled_image.update_tiles(self.scrambled_image.selected_tile)
+        self.game.check_victory(self.scrambled_image.selected_tile)
 
     def on_key_press(self, event: pygame.event.Event):
         """Called when the keyboard shortcut is pressed."""
         if event.key == pygame.K_q:
             image_ops.flip_tiles(self.scrambled_image.tile_arr, self.scrambled_image.selected_tile)
-            self.scrambled_image.update_surface()
-            self.game.check_victory()
+            self.scrambled_image.update_tiles(self.scrambled_image.selected_tile)
+            self.game.check_victory(self.scrambled_image.selected_tile)
 
 
 class RotateButton(ImageOpButton):
@@ -180,15 +293,15 @@ class RotateButton(ImageOpButton):
     def on_click(self, event: pygame.event.Event):
         """Called when the button is clicked."""
         image_ops.rotate_tiles(self.scrambled_image.tile_arr, self.scrambled_image.selected_tile)
-        self.scrambled_image.update_surface()
-        self.game.check_victory()
+        self.scrambled_image.update_tiles(self.scrambled_image.selected_tile)
+        self.game.check_victory(self.scrambled_image.selected_tile)
 
     def on_key_press(self, event: pygame.event.Event):
         """Called when the keyboard shortcut is pressed."""
         if event.key == pygame.K_w:
             image_ops.rotate_tiles(self.scrambled_image.tile_arr, self.scrambled_image.selected_tile)
-            self.scrambled_image.update_surface()
-            self.game.check_victory()
+            self.scrambled_image.update_tiles(self.scrambled_image.selected_tile)
+            self.game.check_victory(self.scrambled_image.selected_tile)
 
 
 class SwapButton(ImageOpButton):
@@ -203,8 +316,8 @@ class SwapButton(ImageOpButton):
         current_tile = self.scrambled_image.selected_tile
         if prev_tile != current_tile:
             image_ops.swap_tiles(self.scrambled_image.tile_arr, prev_tile, current_tile)
-            self.scrambled_image.update_surface()
-            self.game.check_victory()
+            self.scrambled_image.update_tiles(prev_tile, current_tile)
+            self.game.check_victory(prev_tile, current_tile)
             print("Swapped")
 
 
@@ -214,7 +327,7 @@ class NewPuzzleButton(components.LabeledButton):
     puzzle: Optional[Puzzle] = None
     solving: bool = False
     solving_animation_time: float = 0.
-    steps_remaining: list = None
+    next_step: int = 0  # index of the next step of the solution to animate
 
     TIME_PER_STEP = 0.25
 
@@ -228,37 +341,37 @@ class NewPuzzleButton(components.LabeledButton):
         if self.puzzle is not None and not self.solving:
             # Reset puzzle to untouched, start animating solution
             self.scrambled_image.tile_arr[:] = self.puzzle.puzzle_tiles
+            self.scrambled_image.update_surface()
             self.solving = True
-            self.steps_remaining = self.puzzle.puzzle_to_original
+            self.next_step = 0
             self.label = "..."
             self.render_text()
             return
 
+        # The player moves tiles around, so keep the scrambled state to reset to when solving
         puzzle = generate_puzzle(
             self.scrambled_image.tile_arr,
             difficulty=2,
+            copy_puzzle=True,
         )
         self.scrambled_image.update_surface()
         self.puzzle = puzzle
         self.label = "SOLVE"
         self.render_text()
 
-    def update(self, delta_time: float, events: list[pygame.event.Event]):
+    def update(self, delta_time: float, events: SpriteEvents):
         """Handle animating a puzzle solution."""
         super().update(delta_time, events)
 
         if self.solving:
             self.solving_animation_time += delta_time
             if self.solving_animation_time > self.TIME_PER_STEP:
-                step_function, *args = self.steps_remaining.pop(0)
-                if len(args) == 2:
-                    step_function(self.scrambled_image.tile_arr, *args[0], **args[1])
-                else:
-                    step_function(self.scrambled_image.tile_arr, *args[0])
-                self.scrambled_image.update_surface()
+                changed_tiles = self.puzzle.apply_step(self.scrambled_image.tile_arr, self.next_step)
+                self.next_step += 1
+                self.scrambled_image.update_tiles(*changed_tiles)
                 self.solving_animation_time = 0
 
-                if not self.steps_remaining:
+                if self.next_step == len(self.puzzle.puzzle_to_original):
                     self.game.check_victory()  # debug
                     self.solving = False
                     self.puzzle = None
@@ -298,7 +411,7 @@ class FadingAnnouncement(components.Text):
         self.fade_over = fade_over
         self.engine = engine
 
-    def update(self, delta_time: float, events: list[pygame.event.Event]):
+    def update(self, delta_time: float, events: SpriteEvents):
         """Slowly fade out the text after the configured time."""
         super().update(delta_time, events)
 
@@ -313,6 +426,7 @@ class FadingAnnouncement(components.Text):
             fade_percentage = self.faded_over / self.fade_over
             if fade_percentage <= 1.0:
                 self.image.set_alpha(255 - int(fade_percentage * 255))
+                self.dirty = 1
             else:
                 self.engine.remove_sprite("announcements", self)
 
@@ -381,11 +495,14 @@ class GameScreen(Screen):
         self.reset_button = NewPuzzleButton(self.SCALE, self.image, self)
         self.back_button = BackButton(self.SCALE, self)
 
-        engine.add_sprite("buttons", self.flip_button)
-        engine.add_sprite("buttons", self.rotate_button)
-        engine.add_sprite("buttons", self.swap_button)
-        engine.add_sprite("buttons", self.reset_button)
-        engine.add_sprite("buttons", self.back_button)
+        engine.add_sprite(
+            "buttons",
+            self.flip_button,
+            self.rotate_button,
+            self.swap_button,
+            self.reset_button,
+            self.back_button,
+        )
 
         self.size_components(engine.display.get_size())
 
@@ -395,13 +512,26 @@ class GameScreen(Screen):
 
     def on_event(self, engine: Engine, delta_time: float, events: list[pygame.event.Event]):
         """Called each frame with all new events."""
+        # The engine passes on at most one resize per frame
         for event in events:
             if event.type == pygame.VIDEORESIZE:
                 self.size_components((event.w, event.h))
 
-    def check_victory(self):
-        """Determine if the puzzle is solved, and if so display a victory text!"""
-        if self.reset_button.puzzle and (self.image.tile_arr == self.reset_button.puzzle.original_tiles).all():
+    def check_victory(self, *changed_tiles: tuple[int, int]):
+        """
+        Determine if the puzzle is solved, and if so display a victory text!
+
+        The tiles changed by the last operation can be passed to compare those first,
+        as the puzzle cannot be solved while any of them are wrong.
+        """
+        puzzle = self.reset_button.puzzle
+        if puzzle is None:
+            return
+        tile_arr = self.image.tile_arr
+        if not all(np.array_equal(tile_arr[tile], puzzle.original_tiles[tile]) for tile in changed_tiles):
+            return
+
+        if np.array_equal(tile_arr, puzzle.original_tiles):
             print("WIN!")
             self.engine.add_sprite(
                 "announcements",
@@ -451,19 +581,16 @@ class GameScreen(Screen):
             button.set_position((button_stack_x, button_stack_y))
             button_stack_x += button.size[0] + margin
 
-        # Image
-        buttons_row_size = (self.flip_button.size[0] + margin
-                            + self.rotate_button.size[0] + margin
-                            + self.swap_button.size[0] + margin
-                            + self.reset_button.size[0])
-
-        img_side_size = buttons_row_size
+        # Image, as wide as the buttons row
+        img_side_size = button_width
         max_height = height - margin - self.flip_button.size[1] - margin * 2
         if max_height < img_side_size:
             img_side_size = max_height
 
+        # The image is capped at the width of the buttons row, so it is often not resized
+        # at all, in which case only the outline is redrawn
         self.image.fit_size = img_side_size, img_side_size
-        self.image.update_surface()
+        self.image.update_surface(tiles_changed=False)
 
         position = (
             width // 2 - img_side_size // 2,
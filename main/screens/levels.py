@@ -69,10 +69,9 @@ class LevelsScreen(Screen):
                     size=self.BUTTON_SIZE,
                 )
             )
-            engine.add_sprite("buttons", self.level_buttons[-1])
 
         self.back_button = BackButton(engine, scale=self.SCALE)
-        engine.add_sprite("buttons", self.back_button)
+        engine.add_sprite("buttons", *self.level_buttons, self.back_button)
 
         self.size_components(engine.display.get_size())
 
@@ -99,13 +98,8 @@ class LevelsScreen(Screen):
         margin = self.BUTTON_MARGIN * self.SCALE
 
         # Buttons
-        button_width = max(
-            *[button.size[0] for button in self.level_buttons],
-        )
-
-        button_height = max(
-            *[button.size[1] for button in self.level_buttons],
-        )
+        button_width = max(button.size[0] for button in self.level_buttons)
+        button_height = max(button.size[1] for button in self.level_buttons)
 
         button_stack_height = (
             len(self.level_buttons) * button_height + (len(self.level_buttons) - 1) * margin
@@ -79,9 +79,7 @@ class MainMenuScreen(Screen):
         self.credits_button = CreditsButton(engine, scale=self.SCALE, size=self.BUTTON_SIZE)
         self.quit_button = QuitButton(engine, scale=self.SCALE, size=self.BUTTON_SIZE)
 
-        engine.add_sprite("buttons", self.start_button)
-        engine.add_sprite("buttons", self.credits_button)
-        engine.add_sprite("buttons", self.quit_button)
+        engine.add_sprite("buttons", self.start_button, self.credits_button, self.quit_button)
 
         self.size_components(engine.display.get_size())
 
@@ -1,13 +1,11 @@
 import logging
-from pathlib import Path
 
 import pygame
-from PIL import Image
 
 from main.engine import Engine, Screen, components, text_rendering
 from main.engine.text_rendering import LETTER_ASCII
 from main.image_ops import (
-    conv_img_arr_to_tile, conv_pil_to_numpy, flip_tiles, rotate_tiles
+    conv_img_arr_to_tile, flip_tiles, load_image_array, rotate_tiles
 )
 
 
@@ -15,6 +13,7 @@ class TestButton(components.BaseComponent):
     """A count button."""
 
     count: int = 0
+    background: pygame.Surface
 
     def __init__(self):
         super().__init__()
@@ -24,23 +23,20 @@ class TestButton(components.BaseComponent):
         # x, y
         self.set_position((100, 100))
 
+        # The background never changes, so 9-slice it once and only redraw the text on click
+        self.set_9_slice_surface(components.button_image, border=(4, 4, 4, 4), scale=4)
+        self.background = self.image
+
         self.render_text()
 
     def render_text(self):
         """Render the text."""
         # Erase our image
-        button_image_path = Image.open(Path(__file__).parent.parent / 'data' / 'Images' / 'button.png')
-        button_image = conv_pil_to_numpy(button_image_path)
-        self.set_9_slice_surface(button_image, border=(4, 4, 4, 4), scale=4)
+        self.image = self.background.copy()
 
         offset = text_rendering.width_of_rendered_text(str(self.count), scale=4) + 4
 
-        self.set_text(
-            str(self.count),
-            position=(self.size[0] - offset, 10),
-            color=(0, 0, 0),
-            scale=4,
-        )
+        self.set_text(str(self.count), position=(self.size[0] - offset, 10), color=(0, 0, 0), scale=4)
 
     def on_click(self, event: pygame.event.Event):
         """Called when the button is clicked."""
@@ -82,9 +78,7 @@ class TestScreen(Screen):
 
         engine.add_sprite("test-widgets", TestButton())
 
-        logo_png = Image.open(Path(__file__).parent.parent / 'data/Images/puzzle0.png')
-        img_arr = conv_pil_to_numpy(logo_png)
-        logo = components.Image(img_arr, (454, test_text.rect.height + 54))
+        logo = components.Image(load_image_array('puzzle0.png'), (454, test_text.rect.height + 54))
         engine.add_sprite("test-widgets", logo)
 
         # Test img ops
@@ -1,8 +1,12 @@
 import numpy as np
 import numpy.typing as npt
+import pygame
 
 # 8 bit int array of shape (width, height, channel count)
 ImageArray = npt.NDArray[np.uint8]
 
 # 8 bit int array of shape (tiled width, tiled height, tile width, tile height, channel count)
 TileArray = npt.NDArray[np.uint8]
+
+# The events of a frame passed on to the sprites, in the order they arrived
+SpriteEvents = list[pygame.event.Event]